@@ -1,6 +1,11 @@
 import streamlit as st
-import whisper
 import os
+import json
+import html
+import hashlib
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 from openai import APIError # --- NEW: Import specific APIError for better handling ---
 
@@ -72,7 +77,11 @@ st.markdown("""
         color: #FFFFFF;
     }
 
-    /* Interactive transcript hover color */
+    /* Interactive transcript words */
+    .interactive-word {
+        cursor: pointer;
+        padding: 2px;
+    }
     .interactive-word:hover {
         background-color: #0078F2 !important;
         color: white !important;
@@ -95,7 +104,24 @@ SUPPORTED_LANGUAGES = {
     "Auto-Detect": None, "English": "en", "Hindi": "hi", "Spanish": "es",
     "French": "fr", "German": "de", "Japanese": "ja", "Korean": "ko", "Urdu": "ur",
 }
-TEMP_AUDIO_FILENAME = "temp_audio_file.mp3"
+# Languages that need a larger Whisper model than the default for usable accuracy.
+WHISPER_MODELS = {"hi": "small"}
+DEFAULT_WHISPER_MODEL = "base"
+# Per-language transcribe() keyword arguments, built once at import.
+TRANSCRIBE_OPTIONS = {
+    code: {"language": code, "vad_filter": True}
+    for code in SUPPORTED_LANGUAGES.values()
+}
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+WHISPER_SAMPLE_RATE = 16000
+# CPUs this process may run on (respects cpusets/affinity, unlike os.cpu_count()).
+AVAILABLE_CPUS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 2)
+# Roughly one decode thread per physical core; hyperthreads add little to int8 GEMM throughput.
+WHISPER_CPU_THREADS = int(os.environ.get("PODSCRIBE_WHISPER_THREADS") or max(1, AVAILABLE_CPUS // 2))
+CACHE_DIR = os.environ.get("PODSCRIBE_CACHE_DIR", ".podscribe_cache")
+DIARIZATION_MODEL = "pyannote/speaker-diarization-3.1"
+LLM_MODEL = "openai/gpt-4o-mini"
+LLM_CACHE_TAG = LLM_MODEL.replace("/", "_")
 
 try:
     client = OpenAI(
@@ -106,122 +132,243 @@ except Exception as e:
     st.error("Error: OpenRouter API key not found. Please add it to your .streamlit/secrets.toml file.", icon="🚨")
     st.stop()
 
-# --- AI & Transcription Functions (Cached) ---
-@st.cache_data
-def transcribe_audio(file_path, language_code, model_name):
-    st.info(f"Performing first-time transcription with the '{model_name}' model...")
-    model = whisper.load_model(model_name)
-    result = model.transcribe(file_path, language=language_code, fp16=False, word_timestamps=True)
+# Speaker labeling is optional: the gated pyannote model needs a Hugging Face token.
+HF_TOKEN = st.secrets.get("HF_TOKEN")
+
+# --- AI & Transcription Functions ---
+# Results are persisted by the disk cache (load_cached/save_cached); only the models are held in memory.
+@st.cache_resource(show_spinner=False)
+def load_whisper_model(model_name):
+    """Loads a faster-whisper model once and shares it across reruns and sessions."""
+    # Imported here so the landing page does not pay for loading the ML stack.
+    from faster_whisper import WhisperModel
+    return WhisperModel(model_name, device="cpu", compute_type="int8", cpu_threads=WHISPER_CPU_THREADS)
+
+def transcribe_audio(file_path, language_code, model_name, word_timestamps):
+    model = load_whisper_model(model_name)
+    segments, info = model.transcribe(file_path, word_timestamps=word_timestamps, **TRANSCRIBE_OPTIONS[language_code])
+    # Materialize the lazy segment generator into the dict shape openai-whisper returned.
+    result = {"text": "", "segments": [], "language": info.language}
+    for segment in segments:
+        result["segments"].append({
+            "start": segment.start,
+            "end": segment.end,
+            "text": segment.text,
+            "words": [{"start": w.start, "end": w.end, "word": w.word} for w in segment.words or []],
+        })
+    result["text"] = "".join(segment["text"] for segment in result["segments"])
     return result
 
-@st.cache_data
-def get_summary(transcript):
-    """Generates a summary using a model on OpenRouter."""
-    st.info("Generating summary via OpenRouter...")
-    response = client.chat.completions.create(
-        model="openai/gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are an expert podcast summarizer. Provide a concise, easy-to-read summary of the following transcript. Use bullet points to highlight the key topics and discussions."},
-            {"role": "user", "content": f"Transcript:\n{transcript}"},
-        ],
-    )
-    return response.choices[0].message.content
+@st.cache_resource(show_spinner=False)
+def load_diarization_pipeline():
+    """Loads the pyannote diarization pipeline once and shares it across reruns and sessions."""
+    from pyannote.audio import Pipeline  # imports torch; deferred like faster_whisper
+    pipeline = Pipeline.from_pretrained(DIARIZATION_MODEL, use_auth_token=HF_TOKEN)
+    if pipeline is None:
+        # pyannote returns None instead of raising when the model's conditions were not accepted.
+        raise RuntimeError(f"could not load '{DIARIZATION_MODEL}'; accept its conditions on Hugging Face for the HF_TOKEN account")
+    return pipeline
+
+def diarize_audio(file_path):
+    """Finds who speaks when from the audio itself, as a list of speaker turns."""
+    annotation = load_diarization_pipeline()(file_path)
+    return [
+        {"start": turn.start, "end": turn.end, "speaker": speaker}
+        for turn, _, speaker in annotation.itertracks(yield_label=True)
+    ]
+
+def build_transcript_message(transcript):
+    """Builds the transcript message that opens every LLM request.
+
+    Keeping the transcript as an identical leading message lets providers with
+    prefix caching reuse it across the analysis and Q&A requests.
+    """
+    content = f"Podcast transcript (reference):\n{transcript}"
+    if LLM_MODEL.startswith("anthropic/"):
+        # Anthropic models only cache prefixes that are explicitly marked.
+        content = [{"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}]
+    return {"role": "system", "content": content}
+
+ANALYSIS_PROMPT = """You are an expert podcast analyst. Analyze the transcript above and fill in every field:
+- summary: a concise, easy-to-read summary of the key topics and discussions, as a few short points.
+- main_topics: the 5 main topics discussed, each with a one-sentence description.
+- takeaways: the most important takeaways or action items mentioned.
+- resources: any people, books, or products mentioned.
+- sentiment: the overall sentiment, with a brief justification that reads after the label (e.g. "with the speakers expressing optimism about future technology trends").
+- questions: 3 interesting and insightful questions a user might want to ask about the content."""
+
+# Strict structured output: the model returns exactly this shape and Markdown is rendered client-side.
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "array", "items": {"type": "string"}},
+        "main_topics": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"topic": {"type": "string"}, "description": {"type": "string"}},
+                "required": ["topic", "description"],
+                "additionalProperties": False,
+            },
+        },
+        "takeaways": {"type": "array", "items": {"type": "string"}},
+        "resources": {"type": "array", "items": {"type": "string"}},
+        "sentiment": {
+            "type": "object",
+            "properties": {
+                "label": {"type": "string", "enum": ["Positive", "Negative", "Neutral", "Mixed"]},
+                "justification": {"type": "string"},
+            },
+            "required": ["label", "justification"],
+            "additionalProperties": False,
+        },
+        "questions": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["summary", "main_topics", "takeaways", "resources", "sentiment", "questions"],
+    "additionalProperties": False,
+}
 
-@st.cache_data
-def get_insights(transcript):
-    """Generates structured insights from the transcript."""
-    st.info("Extracting key insights via OpenRouter...")
+def get_full_analysis(transcript):
+    """Generates the summary, insights, sentiment and suggested questions in a single structured request."""
     response = client.chat.completions.create(
-        model="openai/gpt-4o-mini",
+        model=LLM_MODEL,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": "analysis", "schema": ANALYSIS_SCHEMA, "strict": True},
+        },
         messages=[
-            {
-                "role": "system",
-                "content": """You are an expert analyst. Analyze the following transcript and provide a structured breakdown. Your output must be in Markdown format.
-
-Provide the following sections:
-- **Main Topics:** A bulleted list of the 5 main topics discussed, with a brief one-sentence description for each.
-- **Key Takeaways:** A bulleted list of the most important takeaways or action items mentioned.
-- **Mentioned Resources:** A bulleted list of any people, books, or products mentioned.
-
-Format each section with a clear, bolded heading (e.g., '**Main Topics**')."""
-            },
-            {"role": "user", "content": f"Transcript:\n{transcript}"},
+            build_transcript_message(transcript),
+            {"role": "user", "content": ANALYSIS_PROMPT},
         ],
     )
-    return response.choices[0].message.content
-
+    return json.loads(response.choices[0].message.content)
 
-@st.cache_data
-def get_sentiment(transcript):
-    """Analyzes the sentiment of the transcript."""
-    st.info("Analyzing sentiment via OpenRouter...")
-    response = client.chat.completions.create(
-        model="openai/gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": """You are a sentiment analysis expert. Analyze the overall sentiment of the following transcript. 
+QA_PROMPT = """You are a helpful Q&A assistant for a podcast. Your task is to answer the user's questions based ONLY on the provided transcript.
+Do not use any external knowledge. If the answer is not found in the transcript, you must say 'I'm sorry, but that information is not available in the podcast transcript.'"""
 
-Your response must be a single sentence in the following format:
-**Overall Sentiment:** [Positive/Negative/Neutral/Mixed], with [a brief justification].
+def build_qa_context(transcript):
+    """Builds the fixed opening of every chat request; the conversation so far is appended after it."""
+    return [build_transcript_message(transcript), {"role": "system", "content": QA_PROMPT}]
 
-Example:
-**Overall Sentiment:** Positive, with the speakers expressing optimism about future technology trends."""
-            },
-            {"role": "user", "content": f"Transcript:\n{transcript}"},
-        ],
-    )
-    return response.choices[0].message.content
-
-@st.cache_data
-def get_suggested_questions(transcript):
-    """Generates a few insightful questions based on the transcript."""
-    st.info("Generating suggested questions via OpenRouter...")
+def get_qa_response(qa_context, messages):
+    """Answers the latest question in the conversation, yielding the answer as it is generated."""
     response = client.chat.completions.create(
-        model="openai/gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant. Based on the provided transcript, generate 3 interesting and insightful questions that a user might want to ask about the content. Your output must be a Markdown bulleted list."},
-            {"role": "user", "content": f"Transcript:\n{transcript}"},
-        ],
+        model=LLM_MODEL,
+        messages=[*qa_context, *messages],
+        stream=True,
     )
-    return response.choices[0].message.content
-
-@st.cache_data
-def get_diarized_transcript(transcript):
-    """Identifies and labels speakers in the transcript using an LLM."""
-    st.info("Identifying speakers via OpenRouter...")
-    response = client.chat.completions.create(
-        model="openai/gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": """You are an expert transcript editor. Your task is to analyze the following transcript and reformat it by identifying and labeling the different speakers.
+    for chunk in response:
+        if chunk.choices:
+            yield chunk.choices[0].delta.content or ""
 
-Use labels like 'Speaker A:', 'Speaker B:', etc.
-If there is only one speaker, do not add any labels.
-Ensure each speaker's turn starts on a new line."""
-            },
-            {"role": "user", "content": f"Transcript:\n{transcript}"},
-        ],
-    )
-    return response.choices[0].message.content
+# --- Helper Functions ---
+def load_cached(key, task):
+    """Returns a result persisted by save_cached, or None if there is none yet."""
+    path = os.path.join(CACHE_DIR, f"{key}.{task}.json")
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def save_cached(key, task, value):
+    """Persists a JSON-serializable result on disk so it survives restarts and is shared across sessions."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(value, f)
+    # Atomic rename, so a concurrent reader never sees a half-written file.
+    os.replace(tmp_path, os.path.join(CACHE_DIR, f"{key}.{task}.json"))
+
+def bullet_list(items):
+    """Renders a list of strings as a Markdown bulleted list."""
+    return "\n".join(f"- {item}" for item in items) or "- None mentioned."
+
+def render_analysis(analysis):
+    """Turns the structured analysis into the Markdown shown in each tab."""
+    topics = [f"**{t['topic']}:** {t['description']}" for t in analysis["main_topics"]]
+    sentiment = analysis["sentiment"]
+    return {
+        "summary": bullet_list(analysis["summary"]),
+        "insights": (
+            f"**Main Topics**\n\n{bullet_list(topics)}\n\n"
+            f"**Key Takeaways**\n\n{bullet_list(analysis['takeaways'])}\n\n"
+            f"**Mentioned Resources**\n\n{bullet_list(analysis['resources'])}"
+        ),
+        "sentiment": f"**Overall Sentiment:** {sentiment['label']}, {sentiment['justification']}",
+        "questions": bullet_list(analysis["questions"]),
+    }
 
-def get_qa_response(transcript, question):
-    """Answers a user's question based on the transcript."""
-    response = client.chat.completions.create(
-        model="openai/gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": """You are a helpful Q&A assistant for a podcast. Your task is to answer the user's questions based ONLY on the provided transcript. 
-                Do not use any external knowledge. If the answer is not found in the transcript, you must say 'I'm sorry, but that information is not available in the podcast transcript.'"""
-            },
-            {"role": "user", "content": f"Here is the podcast transcript:\n\n{transcript}\n\nNow, please answer my question:\n{question}"},
+def label_speakers(transcription_result, speaker_turns):
+    """Builds a speaker-labeled Markdown transcript by aligning Whisper timestamps with diarization turns."""
+    # Align word by word when word timestamps exist, otherwise whole segments.
+    units = []
+    for segment in transcription_result.get('segments', []):
+        units.extend(segment.get('words') or [{**segment, "word": segment['text']}])
+
+    turns = sorted(speaker_turns, key=lambda turn: turn['start'])
+    labels = {}
+    lines = []
+    speaker = turns[0]['speaker'] if turns else None
+    first_turn = 0
+    for unit in units:
+        # Units and turns are both in time order, so skip turns that have already ended.
+        while first_turn < len(turns) and turns[first_turn]['end'] <= unit['start']:
+            first_turn += 1
+        best_overlap = 0.0
+        for turn in turns[first_turn:]:
+            if turn['start'] >= unit['end']:
+                break
+            overlap = min(turn['end'], unit['end']) - max(turn['start'], unit['start'])
+            if overlap > best_overlap:
+                best_overlap, speaker = overlap, turn['speaker']
+        # A unit that falls between turns stays with the previous speaker.
+        label = labels.setdefault(speaker, f"Speaker {chr(ord('A') + len(labels))}")
+        if lines and lines[-1][0] == label:
+            lines[-1][1].append(unit['word'])
+        else:
+            lines.append((label, [unit['word']]))
+
+    if len(labels) <= 1:
+        return "".join(unit['word'] for unit in units).strip()
+    return "\n\n".join(f"**{label}:** {''.join(words).strip()}" for label, words in lines)
+
+def save_upload(uploaded_file):
+    """Streams an upload to a temp file and hashes it in the same pass.
+
+    Returns the temp file path and the SHA-256 hex digest that keys every cached artifact for this audio.
+    """
+    hasher = hashlib.sha256()
+    suffix = os.path.splitext(uploaded_file.name)[1]
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as f:
+        uploaded_file.seek(0)
+        try:
+            while chunk := uploaded_file.read(UPLOAD_CHUNK_SIZE):
+                hasher.update(chunk)
+                f.write(chunk)
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    return f.name, hasher.hexdigest()
+
+def convert_to_wav(file_path):
+    """Decodes an audio file once into the 16 kHz mono WAV that Whisper consumes."""
+    wav_path = os.path.splitext(file_path)[0] + ".16k.wav"
+    result = subprocess.run(
+        [
+            "ffmpeg", "-nostdin", "-y", "-loglevel", "error", "-threads", "0",
+            "-i", file_path, "-vn", "-ac", "1", "-ar", str(WHISPER_SAMPLE_RATE), "-f", "wav", wav_path,
         ],
+        capture_output=True,
+        text=True,
     )
-    return response.choices[0].message.content
+    if result.returncode != 0:
+        if os.path.exists(wav_path):
+            os.remove(wav_path)
+        raise RuntimeError(f"ffmpeg could not decode the audio file: {result.stderr.strip()}")
+    return wav_path
 
-# --- Helper Functions ---
 def format_chat_history(messages):
     """Formats the chat history list into a readable string."""
     history_str = "Your PodScribe Chat History\n"
@@ -230,21 +377,147 @@ def format_chat_history(messages):
         history_str += f"**{msg['role'].capitalize()}:** {msg['content']}\n\n"
     return history_str
 
+WORD_SPAN_TEMPLATE = '<span class="interactive-word" data-start="{start:.2f}">{word} </span>'
+
+# One click handler on the container seeks to the clicked word's data-start.
+# Streamlit does not execute <script> tags in markdown, so it is an inline attribute.
+TRANSCRIPT_CLICK_HANDLER = (
+    "const t = event.target.dataset.start; "
+    "if (t) { const a = document.querySelector('audio'); a.currentTime = +t; a.play(); }"
+)
+
 def create_interactive_transcript(transcription_result):
-    """Generates an HTML string for a clickable transcript."""
-    html = '<div style="line-height: 2.0; font-size: 16px; color: #C9D1D9;">' # Set default text color
+    """Generates an HTML string for a clickable transcript, or a plain one without word timings."""
+    if not any(segment.get('words') for segment in transcription_result.get('segments', [])):
+        return f'<div style="line-height: 2.0; font-size: 16px; color: #C9D1D9;">{html.escape(transcription_result.get("text", ""))}</div>'
+    parts = [f'<div style="line-height: 2.0; font-size: 16px; color: #C9D1D9;" onclick="{TRANSCRIPT_CLICK_HANDLER}">'] # Set default text color
+    append = parts.append
     for segment in transcription_result.get('segments', []):
         for word in segment.get('words', []):
-            start_time = word['start']
-            word_text = word['word']
-            
-            html += (
-                f'<span class="interactive-word" style="cursor: pointer; padding: 2px;" '
-                f'onclick="document.querySelector(\'audio\').currentTime={start_time}; document.querySelector(\'audio\').play();">'
-                f'{word_text} </span>'
-            )
-    html += '</div>'
-    return html
+            append(WORD_SPAN_TEMPLATE.format(start=word['start'], word=html.escape(word['word'])))
+    append('</div>')
+    return "".join(parts)
+
+
+# --- Background Analysis Pipeline ---
+@st.cache_resource
+def get_pipeline_executor():
+    """Shared worker pool that runs analyses off the Streamlit script thread."""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="podscribe-pipeline")
+
+def run_pipeline(audio_path, audio_key, language_code, model_name, word_timestamps, progress):
+    """Transcribes, diarizes and analyzes an uploaded file on a worker thread.
+
+    Progress is reported by updating the `progress` dict, which the UI polls. Returns the
+    values to store in session state, or None if the transcription has no text.
+    """
+    wav_path = None
+    try:
+        transcript_task = f"transcript.{model_name}.{language_code or 'auto'}{'.words' if word_timestamps else ''}"
+        transcription_result = load_cached(audio_key, transcript_task)
+        if transcription_result is None:
+            progress.update(value=0.1, text=f"Transcribing with the '{model_name}' Whisper model...")
+            wav_path = convert_to_wav(audio_path)
+            transcription_result = transcribe_audio(wav_path, language_code, model_name, word_timestamps)
+            save_cached(audio_key, transcript_task, transcription_result)
+
+        plain_transcript = transcription_result.get("text", "")
+        if not plain_transcript.strip():
+            return None
+
+        progress.update(value=0.6, text="Identifying speakers and analyzing the transcript...")
+        # The LLM request is network-bound and diarization is CPU-bound, so overlap them.
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            analysis_task = f"{transcript_task}.structured_analysis_v2.{LLM_CACHE_TAG}"
+            analysis = load_cached(audio_key, analysis_task)
+            analysis_future = None
+            if analysis is None:
+                def save_analysis(future):
+                    # Persist the paid-for analysis as soon as it arrives, even if diarization fails meanwhile.
+                    if future.exception() is None:
+                        save_cached(audio_key, analysis_task, future.result())
+
+                analysis_future = pool.submit(get_full_analysis, plain_transcript)
+                analysis_future.add_done_callback(save_analysis)
+
+            # Speaker labels are a bonus; without them the transcript is shown unlabeled.
+            speaker_notice = ""
+            speaker_turns = load_cached(audio_key, "diarization")
+            if speaker_turns is None and not HF_TOKEN:
+                speaker_turns = []
+                speaker_notice = "Speaker labels are off. Add an HF_TOKEN to your .streamlit/secrets.toml file to enable them."
+            elif speaker_turns is None:
+                try:
+                    if wav_path is None:
+                        wav_path = convert_to_wav(audio_path)
+                    speaker_turns = diarize_audio(wav_path)
+                    save_cached(audio_key, "diarization", speaker_turns)
+                except Exception as e:
+                    speaker_turns = []
+                    speaker_notice = f"Speaker identification failed ({e}), so the transcript is shown without speaker labels."
+
+            if analysis_future is not None:
+                analysis = analysis_future.result()
+
+        progress.update(value=0.95, text="Preparing results...")
+        rendered = render_analysis(analysis)
+        return {
+            "transcript_result": transcription_result,
+            "interactive_html": create_interactive_transcript(transcription_result),
+            "qa_context": build_qa_context(plain_transcript),
+            "transcript_hash": hashlib.sha1(plain_transcript.encode()).hexdigest()[:16],
+            "summary": rendered["summary"],
+            "insights": rendered["insights"],
+            "sentiment": rendered["sentiment"],
+            "questions": rendered["questions"],
+            "diarized_transcript": label_speakers(transcription_result, speaker_turns),
+            "speaker_notice": speaker_notice,
+            "word_timings": word_timestamps,
+        }
+    finally:
+        for path in (audio_path, wav_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+def discard_cancelled_upload(audio_path):
+    """Returns a done-callback that deletes the upload of a run cancelled before it started.
+
+    run_pipeline removes its files itself, but a cancelled run never gets that far.
+    """
+    def callback(future):
+        if future.cancelled() and os.path.exists(audio_path):
+            os.remove(audio_path)
+    return callback
+
+@st.fragment(run_every=1)
+def show_pipeline_progress():
+    """Polls the running analysis, and reruns the whole app once its results are in."""
+    future = st.session_state.get("pipeline")
+    if future is None:
+        return
+    if not future.done():
+        if not future.running():
+            # Every worker is busy with other sessions' analyses.
+            st.progress(0.0, text="Queued: waiting for a free analysis worker...")
+            return
+        progress = st.session_state.pipeline_progress
+        st.progress(progress["value"], text=progress["text"])
+        return
+
+    st.session_state.pipeline = None
+    try:
+        result = future.result()
+        if result is None:
+            st.session_state.pipeline_notice = ("warning", "Transcription returned no text.", "⚠️")
+        else:
+            for key, value in result.items():
+                st.session_state[key] = value
+            st.session_state.analysis_complete = True
+    except APIError as e:
+        st.session_state.pipeline_notice = ("error", f"An API error occurred with OpenRouter: {e}. Please check your API key and credits.", "📡")
+    except Exception as e:
+        st.session_state.pipeline_notice = ("error", f"An unexpected error occurred: {e}", "🔥")
+    st.rerun()
 
 
 # --- Main App ---
@@ -259,6 +532,12 @@ with st.sidebar:
         if 'last_uploaded_file' not in st.session_state or st.session_state.last_uploaded_file != uploaded_file.name:
             st.session_state.analysis_complete = False
             st.session_state.last_uploaded_file = uploaded_file.name
+            # Any analysis in flight belongs to the previous file. A queued one is cancelled so it
+            # does not hold up the pool; one that already started finishes unobserved.
+            if st.session_state.get("pipeline") is not None:
+                st.session_state.pipeline.cancel()
+            st.session_state.pipeline = None
+            st.session_state.pipeline_notice = None
 
         st.audio(uploaded_file)
         selected_language = st.selectbox(
@@ -266,52 +545,62 @@ with st.sidebar:
             options=list(SUPPORTED_LANGUAGES.keys()),
             index=1
         )
-        if st.button("Start Analysis ✨"):
+        # Word-level alignment adds noticeable time to transcription, so it is opt-in.
+        enable_interactive = st.checkbox(
+            "Enable word-level timing (slower)",
+            value=False,
+            help=(
+                "Makes the transcript clickable, so any word jumps to that moment in the audio, "
+                "and lets speaker labels switch mid-sentence. When off, transcription is faster, "
+                "but speakers are assigned per transcript segment, so a speaker change inside a "
+                "segment is missed."
+            ),
+        )
+        analysis_running = st.session_state.get("pipeline") is not None
+        if st.button("Start Analysis ✨", disabled=analysis_running):
             # Initialize session state variables for a new analysis
             st.session_state.analysis_complete = False
             st.session_state.transcript_result = {}
+            st.session_state.transcript_hash = ""
+            st.session_state.interactive_html = ""
+            st.session_state.qa_context = []
             st.session_state.summary = ""
             st.session_state.insights = ""
             st.session_state.sentiment = ""
             st.session_state.questions = ""
             st.session_state.diarized_transcript = ""
+            st.session_state.speaker_notice = ""
+            st.session_state.word_timings = False
             st.session_state.messages = []
+            st.session_state.pipeline_notice = None
 
-            with st.spinner("Starting analysis... Please wait."):
-                # --- MODIFIED: More specific error handling ---
+            with st.spinner("Saving upload..."):
                 try:
-                    with open(TEMP_AUDIO_FILENAME, "wb") as f:
-                        f.write(uploaded_file.getbuffer())
-
-                    model_to_use = "small" if selected_language == "Hindi" else "base"
-                    
-                    transcription_result = transcribe_audio(
-                        TEMP_AUDIO_FILENAME,
-                        SUPPORTED_LANGUAGES[selected_language],
-                        model_to_use
-                    )
-                    
-                    if transcription_result and "text" in transcription_result:
-                        plain_transcript = transcription_result["text"]
-                        
-                        # Store all results in session state
-                        st.session_state.transcript_result = transcription_result
-                        st.session_state.summary = get_summary(plain_transcript)
-                        st.session_state.insights = get_insights(plain_transcript)
-                        st.session_state.sentiment = get_sentiment(plain_transcript)
-                        st.session_state.questions = get_suggested_questions(plain_transcript)
-                        st.session_state.diarized_transcript = get_diarized_transcript(plain_transcript)
-                        st.session_state.analysis_complete = True
-                    else:
-                        st.warning("Transcription returned no text.")
-                
-                except APIError as e:
-                    st.error(f"An API error occurred with OpenRouter: {e}. Please check your API key and credits.", icon="📡")
+                    audio_path, audio_key = save_upload(uploaded_file)
                 except Exception as e:
                     st.error(f"An unexpected error occurred: {e}", icon="🔥")
-                finally:
-                    if os.path.exists(TEMP_AUDIO_FILENAME):
-                        os.remove(TEMP_AUDIO_FILENAME)
+                else:
+                    # The upload is on disk now; the rest runs in the background so the UI stays responsive.
+                    language_code = SUPPORTED_LANGUAGES[selected_language]
+                    progress = {"value": 0.05, "text": "Starting analysis..."}
+                    st.session_state.pipeline_progress = progress
+                    st.session_state.pipeline = get_pipeline_executor().submit(
+                        run_pipeline,
+                        audio_path,
+                        audio_key,
+                        language_code,
+                        WHISPER_MODELS.get(language_code, DEFAULT_WHISPER_MODEL),
+                        enable_interactive,
+                        progress,
+                    )
+                    st.session_state.pipeline.add_done_callback(discard_cancelled_upload(audio_path))
+                    st.rerun()
+
+    if st.session_state.get("pipeline") is not None:
+        show_pipeline_progress()
+    elif st.session_state.get("pipeline_notice"):
+        level, message, icon = st.session_state.pipeline_notice
+        getattr(st, level)(message, icon=icon)
 
     st.markdown("---")
     with st.expander("About PodScribe"):
@@ -365,8 +654,15 @@ if 'analysis_complete' in st.session_state and st.session_state.analysis_complet
             with st.chat_message("user"):
                 st.markdown(prompt)
             with st.chat_message("assistant"):
-                with st.spinner("Thinking..."):
-                    response = get_qa_response(st.session_state.transcript_result["text"], prompt)
+                # Answers depend on the whole conversation, so an identical conversation about the
+                # same transcript is answered from the disk cache.
+                conversation_hash = hashlib.sha1(json.dumps(st.session_state.messages).encode()).hexdigest()[:16]
+                qa_task = f"qa.{LLM_CACHE_TAG}.{conversation_hash}"
+                response = load_cached(st.session_state.transcript_hash, qa_task)
+                if response is None:
+                    response = st.write_stream(get_qa_response(st.session_state.qa_context, st.session_state.messages))
+                    save_cached(st.session_state.transcript_hash, qa_task, response)
+                else:
                     st.markdown(response)
             st.session_state.messages.append({"role": "assistant", "content": response})
         if len(st.session_state.messages) > 0:
@@ -384,11 +680,17 @@ if 'analysis_complete' in st.session_state and st.session_state.analysis_complet
     # Use columns to place the two transcript versions side-by-side
     col1, col2 = st.columns(2)
     with col1:
-        with st.expander("Show Interactive Transcript", expanded=True):
-            interactive_html = create_interactive_transcript(st.session_state.transcript_result)
-            st.markdown(interactive_html, unsafe_allow_html=True)
+        if st.session_state.word_timings:
+            with st.expander("Show Interactive Transcript", expanded=True):
+                st.markdown(st.session_state.interactive_html, unsafe_allow_html=True)
+        else:
+            with st.expander("Show Transcript", expanded=True):
+                st.caption("Word-level timing was off for this analysis. Enable it in the sidebar and run the analysis again to click a word and jump to it in the audio.")
+                st.markdown(st.session_state.interactive_html, unsafe_allow_html=True)
     with col2:
         with st.expander("Show Speaker-Labeled Transcript", expanded=True):
+            if st.session_state.speaker_notice:
+                st.info(st.session_state.speaker_notice, icon="🗣️")
             st.markdown(st.session_state.diarized_transcript)
 else:
     st.info("Please upload a file and click 'Start Analysis' to see the results.")